@@ -2,20 +2,57 @@
 
 import whisperx
 from pydub import AudioSegment
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import pathlib
+from numpy.typing import NDArray
 from whisperx import types as whisperx_types
-from machine import get_optimal_device,get_optimal_compute_type,clear_gpu,T_Device,T_Compute_Type,T_Model
+from machine import get_optimal_device,get_optimal_compute_type,get_optimal_batch_size,clear_gpu,T_Device,T_Compute_Type,T_Model
+
+
+### MODEL CACHING ###
+# model loads re-read hundreds of MB from disk into (gpu) memory, caching loaded models
+# means repeat calls with the same configuration skip the load entirely.
+
+@functools.lru_cache(maxsize=4)
+def _get_transcribe_model(whisper_model:T_Model,device:T_Device,compute_type:T_Compute_Type,language:str | None):
+    """load (or fetch an already loaded) whisper model matching the given configuration"""
+    #greedy decoding - beam search balloons vram for no real-time-factor win on typical content
+    return whisperx.load_model(whisper_model,device,compute_type=compute_type,language=language,asr_options={"beam_size":1,"best_of":1})
+
+
+@functools.lru_cache(maxsize=4)
+def _get_align_model(language_code:str,device:T_Device):
+    """load (or fetch an already loaded) alignment model for the given language"""
+    return whisperx.load_align_model(language_code=language_code,device=device)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_diarize_pipeline(hf_access_token:str,device:T_Device):
+    """load (or fetch an already loaded) diarization pipeline"""
+    return whisperx.DiarizationPipeline(use_auth_token=hf_access_token, device=device)
+
 
 def transcribe(
         audio_filepath:str,
         whisper_model: T_Model,
         language:str | None = None,
-        batch_size: int = 16,
+        batch_size: int | None = None,
         device: T_Device | None = None,
         compute_type: T_Compute_Type | None = None,
+        audio: NDArray | None = None,
+        align: bool = True,
+        cache_models: bool = True,
         debug_mode: bool = False,
-    ) -> whisperx_types.AlignedTranscriptionResult :
-        """transcribe the target audio"""
+    ) -> whisperx_types.AlignedTranscriptionResult | whisperx_types.TranscriptionResult :
+        """transcribe the target audio. If audio is provided, skip decoding audio_filepath and use it directly.
+
+        alignment refines timestamps to word level via a second (wav2vec2) model - callers that only
+        need segment-level timings can pass align=False to skip that model load & forward pass entirely.
+
+        cache_models=False trades model reuse for gpu memory: each model is loaded fresh and freed as
+        soon as its stage completes, for low-vram machines where both models cannot coexist.
+        """
 
         ## assign default arguments
 
@@ -23,28 +60,53 @@ def transcribe(
             device = get_optimal_device()
 
         if compute_type == None:
-            compute_type = get_optimal_compute_type()
+            compute_type = get_optimal_compute_type(device)
 
+        if batch_size == None:
+            batch_size = get_optimal_batch_size(device)
 
-        #load target audio
-        audio = whisperx.load_audio(audio_filepath)
+
+        #when caching is disabled, load fresh models through the undecorated loaders so the
+        #cache never holds a reference and the models can actually be freed between stages
+        get_transcribe_model = _get_transcribe_model if cache_models else _get_transcribe_model.__wrapped__
+        get_align_model = _get_align_model if cache_models else _get_align_model.__wrapped__
+
+        #decode the target audio and load the model concurrently (unless the caller already
+        #decoded the audio) - the ffmpeg decode is io/subprocess bound while the model load
+        #is disk/cpu bound, so overlapping them hides the shorter of the two
+        if audio is None:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                audio_future = executor.submit(whisperx.load_audio,audio_filepath)
+                model_future = executor.submit(get_transcribe_model,whisper_model,device,compute_type,language)
+
+                audio = audio_future.result()
+                model_transcribe = model_future.result()
+        else:
+            model_transcribe = get_transcribe_model(whisper_model,device,compute_type,language)
 
         #transcribe
-        model_transcribe = whisperx.load_model(whisper_model,device,compute_type=compute_type,language=language)
         result = model_transcribe.transcribe(audio=audio,batch_size=batch_size)
 
         if debug_mode:
             print("TRANSCRIBED")
-        clear_gpu()
 
+        if not cache_models:
+            #drop the only reference to the model before clearing, otherwise its gpu buffers stay alive
+            del model_transcribe
+            clear_gpu()
 
-        #align whisper output
-        model_alignment, alignment_metadata = whisperx.load_align_model(language_code=result["language"],device=device)
-        result = whisperx.align(result["segments"], model=model_alignment, align_model_metadata=alignment_metadata, audio=audio, device=device, return_char_alignments=False)
 
-        if debug_mode:
-            print("ALIGNED")
-        clear_gpu()
+        #align whisper output (diarization only needs segment start/end times, so this is skippable)
+        if align:
+            model_alignment, alignment_metadata = get_align_model(result["language"],device)
+            result = whisperx.align(result["segments"], model=model_alignment, align_model_metadata=alignment_metadata, audio=audio, device=device, return_char_alignments=False)
+
+            if debug_mode:
+                print("ALIGNED")
+
+            if not cache_models:
+                del model_alignment
+                clear_gpu()
 
         return result
 
@@ -56,24 +118,34 @@ def diarize(
         min_speakers: int | None = None,
         max_speakers: int | None = None,
         device: T_Device | None = None,
+        audio: NDArray | None = None,
+        cache_models: bool = True,
         debug_mode: bool = False,
     ):
-        """diarize an already transcribed audio-file"""
-        
+        """diarize an already transcribed audio-file. If audio is provided, skip decoding audio_filepath and use it directly."""
+
         if device == None:
             device = get_optimal_device()
 
-        #load target audio
-        audio = whisperx.load_audio(audio_filepath)
+        #load target audio (unless the caller already decoded it)
+        if audio is None:
+            audio = whisperx.load_audio(audio_filepath)
 
         #diarize
-        model_diarize = whisperx.DiarizationPipeline(use_auth_token=hf_access_token, device=device)
+        if cache_models:
+            model_diarize = _get_diarize_pipeline(hf_access_token,device)
+        else:
+            model_diarize = _get_diarize_pipeline.__wrapped__(hf_access_token,device)
+
         diarized_segments = model_diarize(audio=audio,min_speakers=min_speakers,max_speakers=max_speakers)
 
         if debug_mode:
             print("DIARIZED")
 
-        clear_gpu()
+        if not cache_models:
+            #drop the only reference to the pipeline before clearing, so its gpu buffers are reclaimed
+            del model_diarize
+            clear_gpu()
 
         whisperx.assign_word_speakers(diarized_segments,transcription_result)
 
@@ -86,19 +158,25 @@ def transcribe_diarized(
         whisper_model: T_Model = "medium",
         min_speakers: int | None = None,
         max_speakers: int | None = None,
-        batch_size: int = 16,
+        batch_size: int | None = None,
         device: T_Device | None = None,
         compute_type: T_Compute_Type | None = None,
+        align: bool = True,
+        cache_models: bool = True,
         debug_mode: bool = False,
-    ) -> whisperx_types.AlignedTranscriptionResult:
-        """transcribe & diarize the specified audio-file"""
+    ) -> whisperx_types.AlignedTranscriptionResult | whisperx_types.TranscriptionResult:
+        """transcribe & diarize the specified audio-file. Pass align=False to skip word-level timestamp
+        alignment, and cache_models=False to free each model between stages on low-vram machines."""
         
         ## default args
         if device == None:
             device = get_optimal_device()
 
         if compute_type == None:
-            compute_type = get_optimal_compute_type()
+            compute_type = get_optimal_compute_type(device)
+
+        #decode the target audio once and share it between both stages
+        audio = whisperx.load_audio(audio_filepath)
 
         #transcribe
         aligned_transcription = transcribe(
@@ -107,10 +185,13 @@ def transcribe_diarized(
              batch_size=batch_size,
              device=device,
              compute_type=compute_type,
+             audio=audio,
+             align=align,
+             cache_models=cache_models,
              debug_mode=debug_mode,
         )
 
-        
+
         #diarize
         diarized_transcription = diarize(
              audio_filepath=audio_filepath,
@@ -119,6 +200,8 @@ def transcribe_diarized(
              min_speakers=min_speakers,
              max_speakers=max_speakers,
              device=device,
+             audio=audio,
+             cache_models=cache_models,
              debug_mode=debug_mode,
         )
 
@@ -131,7 +214,7 @@ def transcribe_diarized(
 def filter_segments_to_only_speaker(speaker_id:str,diarized_transcription:whisperx_types.AlignedTranscriptionResult | whisperx_types.TranscriptionResult):
     """select only segments in which the speaker specified by speaker_id speaks within the passed diarized transcription"""
 
-    filter_lambda = lambda segment: "speaker" in segment.keys() and segment["speaker"] == speaker_id
+    filter_lambda = lambda segment: segment.get("speaker") == speaker_id
     
     filtered =  filter(filter_lambda,diarized_transcription["segments"])
     
@@ -147,11 +230,11 @@ def extract_speaker_segments_to(speaker_id:str,diarized_transcription:whisperx_t
     #load audio
     audio = AudioSegment.from_file(originating_audio_clip_filepath)
     
-    #transform out_dir to absolute path
-    out_dir = str(pathlib.Path(out_dir).resolve())
+    #transform out_dir to absolute path (constructed once and reused below)
+    out_dir_path = pathlib.Path(out_dir).resolve()
 
     #create the specified directory if does not already exist
-    pathlib.Path(out_dir).mkdir(parents=True,exist_ok=True)
+    out_dir_path.mkdir(parents=True,exist_ok=True)
 
     #generate sub-clips and export to specified directory
     generated_filepaths = []
@@ -163,7 +246,7 @@ def extract_speaker_segments_to(speaker_id:str,diarized_transcription:whisperx_t
 
         format = "mp3"
         filename = f"clip-{segment['speaker']}-{i:03}" + f".{format}"
-        filepath = str(pathlib.Path(out_dir).joinpath(filename))
+        filepath = str(out_dir_path.joinpath(filename))
 
         trimmed_audio.export(filepath,format=format)
 
@@ -8,7 +8,7 @@ import gc
 ### TYPING ###
 
 T_Device = Literal["cpu","cuda"]
-T_Compute_Type = Literal["int8","float16","float32"]
+T_Compute_Type = Literal["int8","int8_float16","float16","float32"]
 T_Model = Literal["tiny","base","medium","large","large-v2"]
 
 
@@ -24,10 +24,45 @@ def get_optimal_device() -> T_Device:
         return "cpu"
     
 
-def get_optimal_compute_type() -> T_Compute_Type:
-    """select the optimal compute type available on the running machine"""
-    #implement
-    return "float32"
+# gpus with less total memory than this should quantise model weights to int8 to leave room for activations
+LOW_VRAM_BYTES = 6 * (1024 ** 3)
+
+
+def get_optimal_compute_type(device: T_Device | None = None) -> T_Compute_Type:
+    """select the optimal compute type available on the running machine.
+
+    fp16 on gpu (int8 weights on low-vram gpus) and int8 on cpu are ~2x faster than fp32
+    under ctranslate2 with negligible accuracy loss.
+    """
+    if device == None:
+        device = get_optimal_device()
+
+    if device == "cuda":
+        if torch.cuda.get_device_properties(0).total_memory < LOW_VRAM_BYTES:
+            return "int8_float16"
+        return "float16"
+    else:
+        return "int8"
+
+
+# rough vram budget (bytes) consumed per item of a whisper inference batch
+VRAM_BYTES_PER_BATCH_ITEM = 256 * (1024 ** 2)
+
+
+def get_optimal_batch_size(device: T_Device | None = None) -> int:
+    """select a transcription batch size that makes use of the memory available on the running machine.
+
+    on gpu the free vram is probed and the batch scaled to fill it (clamped to 8-64),
+    on cpu a modest fixed batch is used.
+    """
+    if device == None:
+        device = get_optimal_device()
+
+    if device == "cuda":
+        free_bytes,_ = torch.cuda.mem_get_info()
+        return max(8,min(64,int(free_bytes // VRAM_BYTES_PER_BATCH_ITEM)))
+    else:
+        return 8
 
 
 ### RUNTIME OPTIMISATION ###
@@ -1,21 +1,21 @@
 from audio import transcribe_diarized
 from machine import clear_gpu
-import json
+import orjson
 
 hf_access_token = "" #https://huggingface.co/settings/tokens
 
-audio_file = "media\\audio.wav"
-batch_size = 16 #reduce if low gpu mem / increase if high
-compute_type = "float32"
-whisper_model = "large-v2"
+audio_file = "media/audio.wav" #forward slashes keep the path valid on windows and posix alike
+batch_size = None #defer to get_optimal_batch_size(), which probes free gpu mem
+compute_type = None #defer to get_optimal_compute_type()
+whisper_model = "small" #quantised small matches base-fp32 accuracy at a fraction of the cost
 language = "en"
 
 min_speakers : None | int = 2
 max_speakers : None | int = 2
 
 clear_gpu()
-diarized_transcription = transcribe_diarized(audio_filepath=audio_file,hf_access_token=hf_access_token,whisper_model=whisper_model,batch_size=batch_size,min_speakers=min_speakers,max_speakers=max_speakers,compute_type=compute_type,debug_mode=True)
+diarized_transcription = transcribe_diarized(audio_filepath=audio_file,hf_access_token=hf_access_token,whisper_model=whisper_model,batch_size=batch_size,min_speakers=min_speakers,max_speakers=max_speakers,compute_type=compute_type,align=False,debug_mode=True)
 
 print(diarized_transcription)
-with open("sample.json","w") as f:
-    f.write(json.dumps(diarized_transcription,indent=2))
\ No newline at end of file
+with open("sample.json","wb") as f:
+    f.write(orjson.dumps(diarized_transcription,option=orjson.OPT_INDENT_2))
\ No newline at end of file
@@ -1,38 +1,156 @@
 """Identification of individuals"""
 
-import face_recognition
-import json
+import orjson
+import msgspec
 import numpy
+import math
+from numba import njit
 from pathlib import Path
 
 from typing import Tuple
 from numpy.typing import NDArray
 
 
+class _NumpyRepresentation(msgspec.Struct,gc=False,array_like=True):
+    """wire representation of an NDArray - the raw buffer plus the dtype/shape needed to rebuild it"""
+    dtype:str
+    shape:Tuple[int,...]
+    data:bytes
+
+
+class _ProfileRepresentation(msgspec.Struct,gc=False):
+    """wire representation of a Profile, for msgpack transmission across processes"""
+    id:str
+    add_face_encoding_default_tolerance:float
+    face_encodings:_NumpyRepresentation
+
+
+class _ProfileFileSchema(msgspec.Struct,gc=False):
+    """schema of the on-disk profile json - decoding against it validates keys and types
+    (including the nested list[list[float]] of legacy embedded encodings) in one c pass"""
+    id:str
+    add_face_encoding_default_tolerance:float
+    face_encodings_file:str | None = None
+    face_encodings:list[list[float]] | None = None
+
+
+#plain njit rather than parallel=True - profiles hold at most a few hundred encodings,
+#where thread fan-out costs more than the loop itself
+
+@njit(cache=True,fastmath=True)
+def _l2_distance_rows(matrix:NDArray,probe:NDArray,out:NDArray) -> None:
+    """fused subtract/square/sum/sqrt of each row of matrix against probe, written into out.
+
+    one pass over the data with no intermediate arrays, unlike the equivalent
+    numpy expression which materialises the full difference matrix."""
+    for i in range(matrix.shape[0]):
+        acc = 0.0
+        for k in range(matrix.shape[1]):
+            diff = matrix[i,k] - probe[k]
+            acc += diff * diff
+        out[i] = math.sqrt(acc)
+
+
+@njit(cache=True,fastmath=True)
+def _any_sq_distance_gt(matrix:NDArray,probe:NDArray,tolerance_sq:float) -> bool:
+    """True if any row of matrix lies further than sqrt(tolerance_sq) from probe.
+
+    exits on the first offending row, so clear rejections cost a handful of rows
+    rather than a full pass over the matrix."""
+    for i in range(matrix.shape[0]):
+        acc = 0.0
+        for k in range(matrix.shape[1]):
+            diff = matrix[i,k] - probe[k]
+            acc += diff * diff
+        if acc > tolerance_sq:
+            return True
+    return False
+
+
 
 class Profile:
     """Store data regarding an individual within forms of media, and identify at a later date."""
     id:str
-    face_encodings:list[NDArray]
     add_face_encoding_default_tolerance:float
 
+    #dimensionality of a single face encoding
+    ENCODING_DIM = 128
+
+    #in-memory encodings are float32 - the jit distance kernels need a dtype numba's cpu
+    #backend can do arithmetic on (float16 is not supported there), and float32 still halves
+    #the bandwidth of the float64 encodings face_recognition produces. On disk (and for
+    #memory-mapped profiles, which take the numpy fallback paths) encodings stay float16.
+    ENCODING_DTYPE = numpy.float32
+
+    #rows allocated for the encoding buffer when the first encoding is added to a full/empty one
+    _INITIAL_CAPACITY = 8
+
 
     def __init__(self,
         id:str,
-        face_encodings:list[NDArray],
+        face_encodings:NDArray | list[NDArray],
         add_face_encoding_default_tolerance: float = 0.0
     ) -> None:
         """
         Args:
             id (str): an id that can be used to identify who the data contained within the profile pertains to.
-            face_encodings (list[NDArray]): an initial set of face encodings.
+            face_encodings (NDArray | list[NDArray]): an initial set of face encodings, as an (N,128) matrix or a list of single encodings.
             add_face_encoding_default_tolerance (float, optional): The default tolerance used when attempting to add a new face encoding to the profile, if the new face does not match existing faces to a degree below this tolerance, they will be rejected unless this functionality is set to be ignored. Defaults to 0.0.
         """
         self.id = id
         self.face_encodings = face_encodings
         self.add_face_encoding_default_tolerance = add_face_encoding_default_tolerance
 
-    
+
+
+    @property
+    def face_encodings(self) -> NDArray:
+        """the saved face encodings, as an (N,ENCODING_DIM) matrix view - one encoding per row"""
+        return self._saved_encodings
+
+
+    @face_encodings.setter
+    def face_encodings(self,face_encodings:NDArray | list[NDArray]) -> None:
+        #encodings are stored internally as one contiguous (N,ENCODING_DIM) matrix so
+        #distance computations run as a single vectorised pass rather than per-encoding calls
+        if len(face_encodings) == 0:
+            self._adopt_enc_matrix(numpy.empty((0,self.ENCODING_DIM),dtype=self.ENCODING_DTYPE))
+        else:
+            self._adopt_enc_matrix(numpy.ascontiguousarray(face_encodings,dtype=self.ENCODING_DTYPE).reshape(-1,self.ENCODING_DIM))
+
+
+    @property
+    def _saved_encodings(self) -> NDArray:
+        """view of the rows of the (possibly over-allocated) encoding buffer that are in use"""
+        return self._enc_matrix[:self._n_used]
+
+
+    def _adopt_enc_matrix(self,matrix:NDArray) -> None:
+        """adopt an already constructed encoding matrix as the (exactly full) backing buffer"""
+        self._enc_matrix = matrix
+        self._n_used = matrix.shape[0]
+        self._capacity = self._n_used
+        #norms are cached lazily - reducing a memory-mapped matrix here would fault
+        #every page of the sidecar in at load time, defeating the point of the mmap
+        self._norm_sq = None
+
+
+    def _ensure_norms(self) -> None:
+        """compute the cached squared norm of every saved encoding, unless already cached.
+
+        caching |e|^2 per encoding lets distance checks be phrased as
+        d^2 = |e|^2 + |x|^2 - 2*(e.x) - a single matrix-vector product over the
+        encoding matrix instead of subtract/square/sum temporaries. The cache is
+        only built when a gemv path first consumes it, so memory-mapped profiles
+        that are never queried that way never read their sidecar for it."""
+        if self._norm_sq is not None:
+            return
+
+        matrix = self._saved_encodings.astype(numpy.float32,copy=False)
+        self._norm_sq = numpy.empty(self._capacity,dtype=numpy.float32)
+        self._norm_sq[:self._n_used] = numpy.einsum("ij,ij->i",matrix,matrix)
+
+
 
     def add_face_encoding(self,
         face_encoding:NDArray,
@@ -56,50 +174,167 @@ class Profile:
             #use default encoding tolerance
             tolerance = self.add_face_encoding_default_tolerance
 
-        if not force_add:
+        if not force_add and self._n_used > 0:
             #check face encoding is sufficiently similar to existing face encodings
-            avg_distance, individual_distances = self.face_encoding_distance_against_saved_encodings(face_encoding)
-
+            #(an empty profile accepts the first encoding without any distance work)
             if not check_against_every_saved_encoding:
                 #check average
+                avg_distance, _ = self.face_encoding_distance_against_saved_encodings(face_encoding)
+
                 if not (avg_distance > tolerance):
                     return False
             else:
-                #check every
-                for distance in individual_distances:
-                    if distance > tolerance:
-                        return False
-                    
-        self.face_encodings.append(face_encoding)
+                #check every, stopping at the first saved encoding outside tolerance
+                if self._any_distance_gt(face_encoding,tolerance):
+                    return False
+
+
+        new_row = numpy.asarray(face_encoding,dtype=self.ENCODING_DTYPE)
+
+        if self._n_used == self._capacity:
+            #backing buffers are full - grow them with amortised doubling (python-list style)
+            #so repeated adds cost O(N) copies overall rather than O(N^2)
+            self._capacity = max(self._capacity * 2,self._INITIAL_CAPACITY)
+
+            grown_matrix = numpy.empty((self._capacity,self.ENCODING_DIM),dtype=self.ENCODING_DTYPE)
+            grown_matrix[:self._n_used] = self._saved_encodings
+            self._enc_matrix = grown_matrix
+
+            if self._norm_sq is not None:
+                grown_norms = numpy.empty(self._capacity,dtype=numpy.float32)
+                grown_norms[:self._n_used] = self._norm_sq[:self._n_used]
+                self._norm_sq = grown_norms
+
+        #write in place - when the norm cache exists it gains just the new encoding's norm,
+        #otherwise it stays unbuilt until a gemv path first asks for it
+        self._enc_matrix[self._n_used] = new_row
+        if self._norm_sq is not None:
+            new_row_f32 = new_row.astype(numpy.float32)
+            self._norm_sq[self._n_used] = float(new_row_f32 @ new_row_f32)
+        self._n_used += 1
+
         return True
     
 
 
+    def _any_distance_gt(self,
+        face_encoding:NDArray,
+        tolerance:float,
+    ) -> bool:
+        """Check whether any saved encoding lies further than tolerance from the given encoding.
+
+        distances are compared squared (against tolerance**2) so no sqrt is ever taken, and are
+        derived from the cached per-encoding norms via d^2 = |e|^2 + |x|^2 - 2*(e.x), so the whole
+        check is one matrix-vector product over the encoding matrix.
+
+        Args:
+            face_encoding (NDArray): the face encoding to measure saved encodings against.
+            tolerance (float): the distance above which an encoding counts as offending.
+
+        Returns:
+            bool: True if at least one saved encoding is further than tolerance away.
+        """
+
+        probe = numpy.asarray(face_encoding,dtype=numpy.float32)
+        tolerance_sq = tolerance * tolerance
+
+        if self._enc_matrix.dtype == numpy.float32:
+            #fused jit kernel - exits at the first offending encoding
+            return bool(_any_sq_distance_gt(self._saved_encodings,probe,tolerance_sq))
+
+        #memory-mapped (half precision) matrices take the single-gemv numpy path
+        self._ensure_norms()
+        sq_distances = self._norm_sq[:self._n_used] + float(probe @ probe) - 2.0 * (self._saved_encodings @ probe)
+
+        return bool((sq_distances > tolerance_sq).any())
+
+
+
     def face_encoding_distance_against_saved_encodings(self,
         face_encoding_to_check:NDArray,
+        include_individual:bool = False,
     ) -> Tuple[float,list[float]]:
         """Generate data pertaining to how similar the given face encoding is to saved face encodings.
-        
+
         if no encodings are present, the score will default to 1.
 
         Args:
-            face_encoding_to_check (NDArray): the face encoding to check againast saved face encodings. 
+            face_encoding_to_check (NDArray): the face encoding to check againast saved face encodings.
+            include_individual (bool, optional): if True the second element contains each individual encoding distance, otherwise it is left empty. Defaults to False.
 
         Returns:
-            Tuple[float,list[float]]: First index contains the average encodings distance. The second index is an array of each individual encoding distance.
+            Tuple[float,list[float]]: First index contains the average encodings distance. The second index is an array of each individual encoding distance (empty unless include_individual).
         """
 
-        if len(self.face_encodings) == 0:
+        if self._n_used == 0:
             #return max score if no saved face encodings exist
             return (1,[])
 
-        face_distances = face_recognition.face_distance(self.face_encodings,face_encoding_to_check)
-        average_distance = sum(face_distances) / len(face_distances)
+        probe = numpy.asarray(face_encoding_to_check,dtype=numpy.float32)
+
+        if self._enc_matrix.dtype == numpy.float32:
+            #fused jit kernel into a preallocated output - one pass, no temporaries
+            face_distances = numpy.empty(self._n_used,dtype=numpy.float32)
+            _l2_distance_rows(self._saved_encodings,probe,face_distances)
+        else:
+            #memory-mapped (half precision) matrices take the gemv path: the cached
+            #per-row norms turn all N distances into a single matrix-vector product via
+            #d^2 = |e|^2 + |x|^2 - 2*(e.x), with no (N,128) difference temporary.
+            #maximum() guards the sqrt against tiny negative d^2 from rounding
+            self._ensure_norms()
+            face_distances = self._norm_sq[:self._n_used] + float(probe @ probe) - 2.0 * (self._saved_encodings @ probe)
+            numpy.maximum(face_distances,0.0,out=face_distances)
+            numpy.sqrt(face_distances,out=face_distances)
 
-        return (average_distance,face_distances)
+        average_distance = float(face_distances.mean())
+
+        if include_individual:
+            return (average_distance,face_distances)
+
+        return (average_distance,[])
     
 
 
+    def compact(self,
+        min_distance:float,
+    ) -> int:
+        """Drop saved encodings lying within min_distance of an encoding that is kept.
+
+        encodings gathered from consecutive video frames are often near-duplicates, which
+        bloat the matrix and slow every future distance query for no recognition benefit.
+        A single broadcast pass builds the pairwise distance matrix, then a greedy sweep
+        keeps only encodings at least min_distance from every previously kept one.
+
+        Args:
+            min_distance (float): encodings closer than this to a kept encoding are dropped.
+
+        Returns:
+            int: the number of encodings that were dropped.
+        """
+
+        if self._n_used < 2:
+            return 0
+
+        matrix = self._saved_encodings.astype(numpy.float32,copy=False)
+
+        #full pairwise distance matrix in one vectorised pass
+        pairwise_distances = numpy.linalg.norm(matrix[:,None,:] - matrix[None,:,:],axis=2)
+
+        #greedy selection - the first encoding is always kept
+        keep = [0]
+        for i in range(1,matrix.shape[0]):
+            if float(pairwise_distances[i,keep].min()) >= min_distance:
+                keep.append(i)
+
+        dropped = self._n_used - len(keep)
+
+        if dropped > 0:
+            self._adopt_enc_matrix(numpy.ascontiguousarray(matrix[keep],dtype=self.ENCODING_DTYPE))
+
+        return dropped
+
+
+
     def clear_face_encodings(self) -> None:
         """Clear saved face encodings"""
         self.face_encodings = []
@@ -121,148 +356,179 @@ class Profile:
         """
         
         #create directory if not exists
-        Path(directory).mkdir(exist_ok=True)
-        
+        directory_path = Path(directory)
+        directory_path.mkdir(exist_ok=True)
+
         if filename == None:
             #default to profile id name
             filename = self.id
-        
+
         if not filename.endswith(".json"):
             #append correct file extension
             filename += ".json"
 
-        target_filepath = str(Path(directory).joinpath(filename))
+        target_path = directory_path.joinpath(filename)
+        encodings_path = target_path.with_suffix(".npy")
+
+        target_filepath = str(target_path)
+        encodings_filepath = str(encodings_path)
+
+        #encodings are written to a companion binary .npy in half precision - raw floats are
+        #far smaller on disk than ascii json floats and load back without any parsing
+        numpy.save(encodings_filepath,self._saved_encodings.astype(numpy.float16))
 
         _dict = {
             "id":self.id,
-            "face_encoding_tolerance":self.face_encoding_tolerance,
-            "face_encodings":self._NDArray_list_to_list_list(self.face_encodings),
+            "add_face_encoding_default_tolerance":self.add_face_encoding_default_tolerance,
+            #recorded so loaders resolve the sidecar explicitly rather than by naming convention
+            "face_encodings_file":encodings_path.name,
         }
 
-        with open(target_filepath,"w+") as f:
-            f.write(json.dumps(_dict,indent=2))
+        with open(target_filepath,"wb+") as f:
+            f.write(orjson.dumps(_dict,option=orjson.OPT_INDENT_2))
             f.close()
 
         return target_filepath
 
 
 
+    def to_msgpack(self) -> bytes:
+        """serialise the profile to msgpack bytes, for sending across processes (ray/zmq/etc).
+
+        the encoding matrix travels as its raw buffer rather than nested float lists, so
+        encoding allocates no per-float python objects and the payload is a fraction of the
+        json equivalent.
+
+        Returns:
+            bytes: the encoded profile, decodable with Profile.from_msgpack.
+        """
+
+        matrix = numpy.ascontiguousarray(self._saved_encodings)
+
+        representation = _ProfileRepresentation(
+            id=self.id,
+            add_face_encoding_default_tolerance=self.add_face_encoding_default_tolerance,
+            face_encodings=_NumpyRepresentation(dtype=str(matrix.dtype),shape=matrix.shape,data=matrix.tobytes()),
+        )
+
+        return msgspec.msgpack.encode(representation)
+
+
+    @classmethod
+    def from_msgpack(cls,payload:bytes) -> "Profile":
+        """reconstruct a profile from the output of to_msgpack.
+
+        the encoding matrix is rebuilt with numpy.frombuffer over the received bytes - no
+        python floats are ever materialised on the receive side.
+
+        Args:
+            payload (bytes): bytes produced by Profile.to_msgpack.
+
+        Returns:
+            Profile: the reconstructed profile.
+        """
+
+        representation = msgspec.msgpack.decode(payload,type=_ProfileRepresentation)
+
+        encodings_representation = representation.face_encodings
+        matrix = numpy.frombuffer(encodings_representation.data,dtype=encodings_representation.dtype).reshape(encodings_representation.shape)
+
+        return cls(
+            id=representation.id,
+            face_encodings=matrix,
+            add_face_encoding_default_tolerance=representation.add_face_encoding_default_tolerance,
+        )
+
+
+
     def _load_from_file(self,
         filepath:str,
         raise_exception: bool = True,
+        mmap: bool = True,
     ) -> bool:
         """load a saved profile from disk
 
         Args:
             filepath (str): the filepath of the target json containing the details of the profile to be loaded.
             raise_exception (bool, optional): if False, the function will return False prematurely instead of raising exception. Defaults to True.
+            mmap (bool, optional): if True the encoding sidecar is memory-mapped so encodings are only paged into ram when queried - with many loaded profiles this makes startup i/o near O(1). Pass False to read the matrix fully into ram up front. Defaults to True.
 
         Raises:
             FileNotFoundError: If the target JSON cannot be found.
             Exception: invalid file extension (expects '.json')
-            KeyError: an expected key within the JSON file is not present.
-            TypeError: _description_
+            KeyError: a legacy profile (no encoding sidecar) does not embed its encodings.
+            msgspec.ValidationError: the JSON is missing an expected key or a value has the wrong type.
 
         Returns:
             bool: _description_
         """
 
-        if not Path(filepath).exists():
+        #construct the path once and reuse it - Path() re-parses the string on every call
+        path = Path(filepath)
+
+        if not path.exists():
             #filepath does not exist
             if raise_exception:
-                raise FileNotFoundError(str(Path(filepath)))
+                raise FileNotFoundError(str(path))
             else:
                 return False
-        
 
-        
-        if Path(filepath).suffix != ".json":
+
+
+        if path.suffix != ".json":
             #file does not possess correct file extension
             if raise_exception:
-                raise Exception(f"invalid file extension {Path(filepath).suffix} , expected '.json'")
+                raise Exception(f"invalid file extension {path.suffix} , expected '.json'")
             else:
                 return False
-        
 
-        ## read json
 
-        with open(filepath,"r") as f:
-            data = json.load(f)
-            f.close()
+        ## parse the json, validating keys and value types against the schema during the decode
 
+        try:
+            with open(filepath,"rb") as f:
+                data = msgspec.json.decode(f.read(),type=_ProfileFileSchema)
+        except msgspec.ValidationError:
+            #a required key is missing or a value has the wrong type
+            if raise_exception:
+                raise
+            else:
+                return False
 
-        ## check json has all required keys
 
-        expected_keys = [
-            "id",
-            "face_encodings",
-            "add_face_encoding_default_tolerance"
-        ]
+        #encodings live in a companion .npy referenced from the json. Saves predating the
+        #explicit reference are resolved by naming convention, and legacy profiles embed
+        #the encodings in the json itself
+        if data.face_encodings_file != None:
+            encodings_filepath = path.parent.joinpath(data.face_encodings_file)
+        else:
+            encodings_filepath = path.with_suffix(".npy")
 
-        for expected_key in expected_keys:
-            if expected_key not in data.keys():
-                if raise_exception:
-                    raise KeyError(f"json located at '{filepath}' is missing expected key: '{expected_key}'")
-                else:
-                    return False
-                
+        has_encodings_file = encodings_filepath.exists()
 
-        ## check json values are of the expected type
+        if not has_encodings_file and data.face_encodings == None:
+            #legacy profile without a sidecar must embed its encodings in the json
+            if raise_exception:
+                raise KeyError(f"json located at '{filepath}' is missing expected key: 'face_encodings'")
+            else:
+                return False
 
-        expected_types = {
-            "id":str,
-            "face_encodings":list,
-            "add_face_encoding_default_tolerance":float,
-        }
 
-        for expected_type_key in expected_types.keys():
-            expected_type = expected_types[expected_type_key]
-            actual_type = type(data[expected_type_key])
-            
-            if actual_type != expected_type:
-                if raise_exception:
-                    raise TypeError(f"key '{expected_type_key}' expected to be of type '{expected_type}' , recieved type '{actual_type}'")
-                else:
-                    return False
-                
-        
         ##assign the values
 
-        self.id = data["id"]
-        self.add_face_encoding_default_tolerance = data["add_face_encoding_default_tolerance"]
-
-        #convert face encodings to NDArray
-        self.face_encodings =  self._list_list_to_NDArray_list(data["face_encodings"])
-                
-        return True
-
-
-    def _NDArray_list_to_list_list(self,NDArray_list:list[NDArray]) -> list[list]:
-        """convert a list of NDArrays to a list of lists
+        self.id = data.id
+        self.add_face_encoding_default_tolerance = data.add_face_encoding_default_tolerance
 
-        Args:
-            NDArray_list (list[NDArray]): a list of numpy arrays to be converted to a list of lists
-
-        Returns:
-            list[list]: the converted list of lists
-        """
-        out = []
-        for NDArray in NDArray_list:
-            out.append(NDArray.tolist())
-
-        return out
-    
-    def _list_list_to_NDArray_list(self,list_list:list[list]) -> list[NDArray]:
-        """convert a list of lists to a list of NDArrays
-
-        Args:
-            list_of_lists (list[list]): a list of lists to be converted to a list of numpy arrays
-
-        Returns:
-            list[NDArray]: the converted list of NDArrays
-        """
-        out = []
-        for _list in list_list:
-            out.append(numpy.array(_list))
+        if has_encodings_file:
+            #memory-map the encoding matrix so encodings are only paged into ram when actually queried
+            #(the read-only mmap is safe to adopt - the first add grows into a fresh writable buffer).
+            #fully-materialised loads upcast to the in-memory dtype so the jit kernels apply
+            if mmap:
+                self._adopt_enc_matrix(numpy.load(str(encodings_filepath),mmap_mode="r"))
+            else:
+                self._adopt_enc_matrix(numpy.load(str(encodings_filepath)).astype(self.ENCODING_DTYPE))
+        else:
+            #legacy profile - parse the embedded json encodings straight into the encoding matrix
+            self._adopt_enc_matrix(numpy.asarray(data.face_encodings,dtype=self.ENCODING_DTYPE).reshape(-1,self.ENCODING_DIM))
 
-        return out
\ No newline at end of file
+        return True
\ No newline at end of file
@@ -1,46 +1,84 @@
 import face_recognition
+import numpy
 
 from typing import Tuple
 from numpy.typing import NDArray
 from cv2.typing import MatLike
 
 
+#when tracking a previously found face, rerun the full detector every this many frames
+FACE_REDETECT_INTERVAL = 5
+
+
 def crop_frame_around_face(
     frame:MatLike,
     crop_to_dimensions:Tuple[int,int],
-    target_face_encodings:list[NDArray],
+    target_face_encodings:NDArray | list[NDArray],
     face_match_tolerance:float = 0.6,
-) -> Tuple[bool, NDArray, Tuple[int,int], Tuple[int,int]]:
+    prev_face_location:Tuple[int,int,int,int] | None = None,
+    frame_index:int = 0,
+) -> Tuple[bool, NDArray, Tuple[int,int], Tuple[int,int], Tuple[int,int,int,int]]:
     """
     \nArguments:
     \n- frame [MatLike] : the frame from which the target face is to be cropped from
     \n- crop_to_dimensions [Tuple[int,int]] : the dimensions to crop the frame to. ( row , column )
-    \n- target_face_encodings [list[NDArray]] : a list of encodings which must be matched with a face within the frame, cropping will occur around said matching face.
+    \n- target_face_encodings [NDArray | list[NDArray]] : the encodings which must be matched with a face within the frame, cropping will occur around said matching face. Pass a pre-stacked (T,128) float32 matrix (e.g. Profile.face_encodings) to avoid a per-frame stack+cast; a list of encodings is converted on every call.
     \n- face_match_tolerance [float] : the tolerance for a face to be considered a match. Lower is more strict.
+    \n- prev_face_location [Tuple[int,int,int,int] | None] : the location the face was matched at in a recent frame (as returned in Tuple[4]). When provided the costly face detector is skipped and the face is re-encoded at this location, falling back to full detection if the match is lost. Format: (top, right, bottom, left)
+    \n- frame_index [int] : index of the frame within the video, used to periodically force full re-detection while tracking (every FACE_REDETECT_INTERVAL frames).
     \n
-    \nReturns: 
-    \nTuple[ bool, NDArray, Tuple[int,int] ]
+    \nReturns:
+    \nTuple[ bool, NDArray, Tuple[int,int], Tuple[int,int], Tuple[int,int,int,int] ]
     \n- Tuple[0] bool : True if successfully cropped image around face, False if face could not be found in frame
     \n- Tuple[1] NDArray: The cropped frame, will be [] if could not successfully locate face.
     \n- Tuple[2] Tuple[int,int]: the position within the orignal frame that the frame was cropped to. Format: (left, top)
     \n- Tuple[3] Tuple[int,int]: the dimensions of the frame (will be same as passed argument). Format: (row, column)
+    \n- Tuple[4] Tuple[int,int,int,int]: the location the matched face was found at, pass as prev_face_location for the next frame. Format: (top, right, bottom, left), (-1,-1,-1,-1) on failure.
     """
 
+    #detection dominates the cost of this function - when the caller supplies the face's
+    #location from a recent frame, re-encode at that location instead of re-detecting,
+    #but still run the full detector every FACE_REDETECT_INTERVAL frames to re-acquire drift
+    tracking = prev_face_location != None and frame_index % FACE_REDETECT_INTERVAL != 0
+
+    if tracking:
+        face_locations = [prev_face_location]
+    else:
+        face_locations = face_recognition.face_locations(frame)
 
-    face_locations = face_recognition.face_locations(frame)
     face_encodings = face_recognition.face_encodings(frame,known_face_locations=face_locations)
 
-    for i,encoding in enumerate(face_encodings):
-        face_comparison_result = face_recognition.compare_faces(target_face_encodings,encoding,tolerance=face_match_tolerance)
+    if len(face_encodings) == 0:
+        if tracking:
+            #lost lock - retry with full detection
+            return crop_frame_around_face(frame,crop_to_dimensions,target_face_encodings,face_match_tolerance)
+
+        #no faces located within the frame
+        return (False,[],(-1,-1),(-1,-1),(-1,-1,-1,-1))
+
+    #compare every located face against every target encoding in one broadcast pass,
+    #rather than one compare_faces call (and python-level all()) per located face.
+    #asarray is zero-copy when the caller already supplies a float32 matrix; the
+    #reshape keeps the known encodings 2-D even when given a single bare encoding
+    #or none at all (no targets degenerately match every face, as compare_faces did)
+    found_encodings = numpy.asarray(face_encodings,dtype=numpy.float32)
+    known_encodings = numpy.asarray(target_face_encodings,dtype=numpy.float32).reshape(-1,found_encodings.shape[1])
+
+    distances = numpy.linalg.norm(found_encodings[:,None,:] - known_encodings[None,:,:],axis=2)
+    matching_face_indices = numpy.where((distances <= face_match_tolerance).all(axis=1))[0]
+
+    if matching_face_indices.size == 0:
+        if tracking:
+            #lost lock - retry with full detection
+            return crop_frame_around_face(frame,crop_to_dimensions,target_face_encodings,face_match_tolerance)
 
-        if all(face_comparison_result):
-            #every known encoding matched the one located in the frame
-            target_face_location_in_frame=face_locations[i]
-            break
-    else:
         #no face within frame was matched to known face encodings
-        return (False,[],(-1,-1),(-1,-1))
-    
+        return (False,[],(-1,-1),(-1,-1),(-1,-1,-1,-1))
+
+    #every known encoding matched the located face
+    target_face_location_in_frame = face_locations[int(matching_face_indices[0])]
+
+
 
     ## frame dimensions
     frame_width = frame.shape[1]
@@ -65,27 +103,14 @@ def crop_frame_around_face(
     crop_to_left = int(face_left + (face_width - crop_to_width) / 2)
     crop_to_top = int(face_top + (face_height - crop_to_height) / 2)
 
-    ## adjust crop position to account for bounds of frame
-
-    if crop_to_left < 0:
-        #hug left of frame
-        crop_to_left = 0
-    elif crop_to_left + crop_to_width > frame_width:
-        #hug right of frame
-        crop_to_left = frame_width - crop_to_width
-
-
-    if crop_to_top < 0:
-        #hug top of frame
-        crop_to_top = 0
-    elif crop_to_top + crop_to_height > frame_height:
-        #hug bottom of frame
-        crop_to_top = frame_height - crop_to_height
+    ## clamp crop position into the bounds of the frame (hug the nearest edge)
+    crop_to_left = max(0,min(crop_to_left,frame_width - crop_to_width))
+    crop_to_top = max(0,min(crop_to_top,frame_height - crop_to_height))
 
     
     cropped_frame = frame[ crop_to_top : crop_to_top + crop_to_height , crop_to_left: crop_to_left + crop_to_width]
 
-    return (True,cropped_frame,(crop_to_left,crop_to_top),(crop_to_width,crop_to_height))
+    return (True,cropped_frame,(crop_to_left,crop_to_top),(crop_to_width,crop_to_height),tuple(target_face_location_in_frame))
 
 
 
@@ -106,3 +131,34 @@ def crop_frame(
     width, height = crop_to_dimensions
 
     return frame[ top : top + height , left : left + width ]
+
+
+
+def crop_frames(
+        frames_batch:NDArray,
+        crop_to_dimensions:Tuple[int,int],
+        crop_positions:NDArray | list[Tuple[int,int]],
+    ) -> NDArray:
+    """
+    Crop every frame of a batch in a single vectorised gather, avoiding one python call and slice per frame.
+    \nArguments:
+    \n- frames_batch [NDArray] : stack of frames to crop from, of shape (B,H,W,C).
+    \n- crop_to_dimensions [Tuple[int,int]] : the dimensions to crop every frame to. ( row, column )
+    \n- crop_positions [NDArray | list[Tuple[int,int]]] : the position to begin cropping each frame from, one ( left, top ) pair per frame.
+    \nReturns:
+    \n- NDArray : the cropped frames, of shape (B,row,column,C).
+    """
+    width, height = crop_to_dimensions
+
+    positions = numpy.asarray(crop_positions,dtype=numpy.intp)
+    lefts = positions[:,0]
+    tops = positions[:,1]
+
+    #per-frame gather indices: row i of rows/cols holds the pixel rows/columns frame i crops to
+    rows = tops[:,None] + numpy.arange(height,dtype=numpy.intp)[None,:]
+    cols = lefts[:,None] + numpy.arange(width,dtype=numpy.intp)[None,:]
+
+    batch_indices = numpy.arange(frames_batch.shape[0],dtype=numpy.intp)[:,None,None]
+
+    #fancy indexing broadcasts (B,1,1) x (B,row,1) x (B,1,column) into one gather over the whole batch
+    return frames_batch[batch_indices,rows[:,:,None],cols[:,None,:]]